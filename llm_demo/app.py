@@ -16,27 +16,40 @@ import os
 from contextlib import asynccontextmanager
 from typing import Optional
 
+import jinja2
 import uvicorn
 from fastapi import APIRouter, Body, FastAPI, HTTPException, Request
 from fastapi.responses import PlainTextResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from markdown import markdown
+from markdown_it import MarkdownIt
 from starlette.middleware.sessions import SessionMiddleware
 
 from orchestrator import BaseOrchestrator, createOrchestrator
 
 routes = APIRouter()
-templates = Jinja2Templates(directory="templates")
+SESSION_EXPIRED = "Session expired, reload the page to start a new one"
+md = MarkdownIt()
+templates = Jinja2Templates(
+    env=jinja2.Environment(
+        loader=jinja2.FileSystemLoader("templates"),
+        autoescape=True,
+        # Templates don't change while the app runs, so skip mtime checks
+        auto_reload=False,
+    )
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # FastAPI app startup event
     print("Loading application...")
+    # Compile the page template once instead of on the first request
+    templates.get_template("index.html")
+    await app.state.orchestration_type.warm_up()
     yield
     # FastAPI app shutdown event
-    app.state.orchestration_type.close_clients()
+    await app.state.orchestration_type.close_clients()
 
 
 @routes.get("/")
@@ -52,7 +65,7 @@ async def index(request: Request):
         "index.html",
         {
             "request": request,
-            "messages": request.session["history"],
+            "messages": orchestrator.get_user_session_history(session["uuid"]),
             "client_id": request.app.state.client_id,
         },
     )
@@ -68,6 +81,10 @@ async def login_google(
         raise HTTPException(status_code=401, detail="No user credentials found")
     # create new request session
     orchestrator = request.app.state.orchestration_type
+    if "uuid" not in request.session or not orchestrator.user_session_exist(
+        request.session["uuid"]
+    ):
+        raise HTTPException(status_code=410, detail=SESSION_EXPIRED)
     orchestrator.set_user_session_header(request.session["uuid"], str(user_id_token))
     print("Logged in to Google.")
 
@@ -87,13 +104,12 @@ async def chat_handler(request: Request, prompt: str = Body(embed=True)):
             status_code=400, detail="Error: Invoke index handler before start chatting"
         )
 
-    # Add user message to chat history
-    request.session["history"].append({"type": "human", "data": {"content": prompt}})
     orchestrator = request.app.state.orchestration_type
+    if not orchestrator.user_session_exist(request.session["uuid"]):
+        raise HTTPException(status_code=410, detail=SESSION_EXPIRED)
     output = await orchestrator.user_session_invoke(request.session["uuid"], prompt)
     # Return assistant response
-    request.session["history"].append({"type": "ai", "data": {"content": output}})
-    return markdown(output)
+    return md.render(output)
 
 
 @routes.post("/reset")
@@ -105,9 +121,6 @@ async def reset(request: Request):
 
     uuid = request.session["uuid"]
     orchestrator = request.app.state.orchestration_type
-    if not orchestrator.user_session_exist(uuid):
-        raise HTTPException(status_code=500, detail=f"Current user session not found")
-
     await orchestrator.user_session_reset(uuid)
     request.session.clear()
 
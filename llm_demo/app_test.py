@@ -12,6 +12,36 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import init_app
+from orchestrator.langchain_tools import langchain_tools_orchestrator
+
+
+@pytest.fixture
+def app(orchestrator_state):
+    return init_app("langchain-tools", "fake client id", "fake secret")
+
 
 def test_empty():
     pass
+
+
+@patch.object(langchain_tools_orchestrator, "MAX_USER_SESSIONS", 1)
+def test_chat_after_eviction_asks_to_reload(app):
+    with TestClient(app) as first, TestClient(app) as second:
+        first.get("/")
+        assert first.post("/chat", json={"prompt": "hi"}).text == "<p>Done</p>\n"
+        # A second visitor pushes the first session out
+        second.get("/")
+        response = first.post("/chat", json={"prompt": "hi"})
+        assert response.status_code == 410
+        response = first.post("/login/google", data={"credential": "token"})
+        assert response.status_code == 410
+
+        # Reloading the page starts a new session
+        assert first.get("/").status_code == 200
+        assert first.post("/chat", json={"prompt": "hi"}).status_code == 200
@@ -0,0 +1,45 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+from unittest.mock import patch
+
+import pytest
+from langchain_community.llms.fake import FakeListLLM
+
+from orchestrator.langchain_tools.langchain_tools_orchestrator import (
+    LangChainToolsOrchestrator,
+    UserAgent,
+)
+
+FINAL_ANSWER = 'Action:\n```\n{"action": "Final Answer", "action_input": "Done"}\n```'
+
+
+@pytest.fixture
+def orchestrator_state():
+    """Give each test its own class-level orchestrator state and a fake LLM.
+
+    Every turn answers "Done" after a short delay, so tests can act while a
+    turn is in flight.
+    """
+    with patch.object(
+        UserAgent, "_llm", FakeListLLM(responses=[FINAL_ANSWER], sleep=0.1)
+    ), patch.object(
+        LangChainToolsOrchestrator, "_user_sessions", OrderedDict()
+    ), patch.object(
+        LangChainToolsOrchestrator, "_histories", {}
+    ), patch.object(
+        LangChainToolsOrchestrator, "_agent_pool", []
+    ):
+        yield
@@ -12,20 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
+import json
 import os
 import uuid
+from collections import OrderedDict
 from datetime import date
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
 from fastapi import HTTPException
 from langchain.agents import AgentType, initialize_agent
 from langchain.agents.agent import AgentExecutor
+from langchain.agents.structured_chat.output_parser import (
+    StructuredChatOutputParser,
+    StructuredChatOutputParserWithRetries,
+)
 from langchain.globals import set_verbose  # type: ignore
-from langchain.memory import ChatMessageHistory, ConversationBufferMemory
+from langchain.memory import ChatMessageHistory, ConversationBufferWindowMemory
 from langchain.prompts.chat import ChatPromptTemplate
 from langchain.tools import StructuredTool
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
 from langchain_google_vertexai import VertexAI
 
@@ -34,35 +41,85 @@ from .tools import initialize_tools
 
 set_verbose(bool(os.getenv("DEBUG", default=False)))
 MODEL = "gemini-pro"
+# aiohttp connection pool limits shared by all user sessions
+AIOHTTP_LIMIT = int(os.getenv("AIOHTTP_LIMIT", default=1000))
+AIOHTTP_LIMIT_HOST = int(os.getenv("AIOHTTP_LIMIT_HOST", default=500))
 BASE_HISTORY = {
     "type": "ai",
     "data": {"content": "I am an SFO Airport Assistant, ready to assist you."},
 }
+# Number of recent human/ai turns kept in a session's history
+MAX_HISTORY_TURNS = 25
+# Number of recent turns included in the LLM prompt
+MEMORY_WINDOW_TURNS = int(os.getenv("MEMORY_WINDOW_TURNS", default=10))
+# Idle sessions are evicted beyond this many, least recently used first
+MAX_USER_SESSIONS = int(os.getenv("MAX_USER_SESSIONS", default=1000))
+
+
+class MultiActionOutputParser(StructuredChatOutputParser):
+    """Output parser that accepts a list of independent actions.
+
+    AgentExecutor runs every action returned for a step concurrently, so
+    independent tool calls take max(t_i) instead of sum(t_i).
+    """
+
+    def parse(  # type: ignore[override]
+        self, text: str
+    ) -> Union[List[AgentAction], AgentAction, AgentFinish]:
+        action_match = self.pattern.search(text)
+        if action_match is None:
+            return super().parse(text)
+        try:
+            response = json.loads(action_match.group(1).strip(), strict=False)
+        except json.JSONDecodeError:
+            return super().parse(text)
+        if not isinstance(response, list) or len(response) < 2:
+            return super().parse(text)
+        try:
+            for r in response:
+                if r["action"] == "Final Answer":
+                    return AgentFinish({"output": r["action_input"]}, text)
+            # Only the first action carries the log so the scratchpad isn't repeated
+            return [
+                AgentAction(
+                    r["action"], r.get("action_input", {}), text if i == 0 else ""
+                )
+                for i, r in enumerate(response)
+            ]
+        except Exception as e:
+            raise OutputParserException(f"Could not parse LLM output: {text}") from e
 
 
 class UserAgent:
-    client: ClientSession
     agent: AgentExecutor
-
-    def __init__(self, client: ClientSession, agent: AgentExecutor):
-        self.client = client
+    # Per-user headers sent along with every tool request
+    headers: Dict[str, str]
+    # Number of turns currently running on this agent
+    turns_in_flight: int
+    # LLM client shared by all user sessions
+    _llm: Optional[VertexAI] = None
+
+    def __init__(self, agent: AgentExecutor, headers: Dict[str, str]):
         self.agent = agent
+        self.headers = headers
+        self.turns_in_flight = 0
+
+    @classmethod
+    def _get_llm(cls) -> VertexAI:
+        if cls._llm is None:
+            cls._llm = VertexAI(max_output_tokens=512, model_name=MODEL)
+        return cls._llm
 
     @classmethod
     def initialize_agent(
         cls,
-        client: ClientSession,
         tools: List[StructuredTool],
         history: List[BaseMessage],
         prompt: ChatPromptTemplate,
+        headers: Dict[str, str],
     ) -> "UserAgent":
-        llm = VertexAI(max_output_tokens=512, model_name=MODEL)
-        memory = ConversationBufferMemory(
-            chat_memory=ChatMessageHistory(messages=history),
-            memory_key="chat_history",
-            input_key="input",
-            output_key="output",
-        )
+        llm = cls._get_llm()
+        memory = cls.create_memory(history)
         agent = initialize_agent(
             tools,
             llm,
@@ -72,25 +129,65 @@ class UserAgent:
             max_iterations=3,
             early_stopping_method="generate",
             return_intermediate_steps=True,
+            agent_kwargs={
+                "output_parser": StructuredChatOutputParserWithRetries.from_llm(
+                    llm, base_parser=MultiActionOutputParser()
+                )
+            },
         )
         agent.agent.llm_chain.prompt = prompt  # type: ignore
-        return UserAgent(client, agent)
+        return UserAgent(agent, headers)
 
-    async def close(self):
-        await self.client.close()
+    @staticmethod
+    def create_memory(history: List[BaseMessage]) -> ConversationBufferWindowMemory:
+        return ConversationBufferWindowMemory(
+            k=MEMORY_WINDOW_TURNS,
+            chat_memory=ChatMessageHistory(messages=history),
+            memory_key="chat_history",
+            input_key="input",
+            output_key="output",
+        )
+
+    def bind_session(self, history: List[BaseMessage], prompt: ChatPromptTemplate):
+        """Rebind a pooled agent to a new user session."""
+        self.headers = {}
+        self.agent.memory = self.create_memory(history)
+        self.agent.agent.llm_chain.prompt = prompt  # type: ignore
+
+    def release_session(self):
+        """Drop per-user state before returning the agent to the pool."""
+        self.headers = {}
+        self.agent.memory = None
 
     async def invoke(self, prompt: str) -> Dict[str, Any]:
+        self.turns_in_flight += 1
         try:
             response = await self.agent.ainvoke({"input": prompt})
         except Exception as err:
             raise HTTPException(status_code=500, detail=f"Error invoking agent: {err}")
+        finally:
+            self.turns_in_flight -= 1
+        # The window only limits the prompt, so also drop turns that fell out of it
+        memory = self.agent.memory
+        if isinstance(memory, ConversationBufferWindowMemory):
+            messages = memory.chat_memory.messages
+            # Not messages[: -2 * k], which deletes nothing when k is 0
+            del messages[: max(len(messages) - 2 * memory.k, 0)]
         return response
 
 
 class LangChainToolsOrchestrator(BaseOrchestrator):
-    _user_sessions: Dict[str, UserAgent] = {}
-    # aiohttp context
-    connector = None
+    # Active user sessions, least recently used first
+    _user_sessions: OrderedDict[str, UserAgent] = OrderedDict()
+    # Chat history per user session, kept server-side instead of in the cookie
+    _histories: Dict[str, List[Any]] = {}
+    # Idle agents from reset sessions, reused by new sessions
+    _agent_pool: List[UserAgent] = []
+    # aiohttp context shared by all user sessions
+    client: Optional[ClientSession] = None
+    # Prompt template shared by all user sessions, rebuilt daily
+    prompt: Optional[ChatPromptTemplate] = None
+    prompt_date: Optional[date] = None
 
     @classproperty
     def kind(cls):
@@ -105,43 +202,115 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
         if "uuid" not in session:
             session["uuid"] = str(uuid.uuid4())
         id = session["uuid"]
-        if "history" not in session:
-            session["history"] = [BASE_HISTORY]
-        history = self.parse_messages(session["history"])
-        client = await self.create_client_session()
-        tools = await initialize_tools(client)
-        prompt = self.create_prompt_template(tools)
-        agent = UserAgent.initialize_agent(client, tools, history, prompt)
+        # Evict first, so that the new session can reuse the evicted agent
+        if len(self._user_sessions) >= MAX_USER_SESSIONS:
+            self.user_session_evict()
+        history = self.parse_messages(self._histories.setdefault(id, [BASE_HISTORY]))
+        if self._agent_pool:
+            agent = self._agent_pool.pop()
+            prompt = self.create_prompt_template(agent.agent.tools)  # type: ignore
+            agent.bind_session(history, prompt)
+        else:
+            agent = await self.create_agent(history)
         self._user_sessions[id] = agent
 
+    async def create_agent(self, history: List[BaseMessage]) -> UserAgent:
+        client = await self.get_client_session()
+        # Tools look the headers up on every call, since a pooled agent gets a
+        # new headers dict for each session it serves
+        tools = await initialize_tools(client, lambda: agent.headers)
+        prompt = self.create_prompt_template(tools)
+        agent = UserAgent.initialize_agent(tools, history, prompt, {})
+        return agent
+
     async def user_session_invoke(self, uuid: str, prompt: str) -> str:
         user_session = self.get_user_session(uuid)
+        history = self._histories[uuid]
+        # Add user message to chat history
+        history.append({"type": "human", "data": {"content": prompt}})
         # Send prompt to LLM
-        response = await user_session.invoke(prompt)
+        try:
+            response = await user_session.invoke(prompt)
+        finally:
+            if self._user_sessions.get(uuid) is not user_session:
+                # The session was reset during this turn
+                self.release_agent(user_session)
+        # Add assistant response to chat history
+        history.append({"type": "ai", "data": {"content": response["output"]}})
+        # Keep the greeting and the most recent turns
+        del history[1 : -2 * MAX_HISTORY_TURNS]
         return response["output"]
 
     async def user_session_reset(self, uuid: str):
-        user_session = self.get_user_session(uuid)
-        await user_session.close()
-        del user_session
+        # Pop first so that concurrent resets can't both release the agent
+        user_session = self._user_sessions.pop(uuid, None)
+        if user_session is None:
+            raise HTTPException(
+                status_code=500, detail=f"Current user session not found"
+            )
+        self._histories.pop(uuid, None)
+        self.release_agent(user_session)
+
+    def user_session_evict(self):
+        """Drop the least recently used idle session and pool its agent."""
+        # Sessions with a turn in flight are skipped, their agent is still busy
+        uuid = next(
+            (
+                uuid
+                for uuid, user_session in self._user_sessions.items()
+                if user_session.turns_in_flight == 0
+            ),
+            None,
+        )
+        if uuid is None:
+            return
+        self._histories.pop(uuid, None)
+        self.release_agent(self._user_sessions.pop(uuid))
+
+    def release_agent(self, user_session: UserAgent):
+        """Pool the agent of a closed session once no turn is running on it."""
+        # Otherwise a new session could rebind it while a turn is still using
+        # the old session's memory and headers
+        if user_session.turns_in_flight == 0:
+            user_session.release_session()
+            self._agent_pool.append(user_session)
 
     def get_user_session(self, uuid: str) -> UserAgent:
+        self._user_sessions.move_to_end(uuid)
         return self._user_sessions[uuid]
 
-    async def get_connector(self) -> TCPConnector:
-        if self.connector is None:
-            self.connector = TCPConnector(limit=100)
-        return self.connector
-
-    async def create_client_session(self) -> ClientSession:
-        return ClientSession(
-            connector=await self.get_connector(),
-            connector_owner=False,
-            headers={},
-            raise_for_status=True,
-        )
+    def get_user_session_history(self, uuid: str) -> List[Any]:
+        self._user_sessions.move_to_end(uuid)
+        return self._histories[uuid]
+
+    async def get_client_session(self) -> ClientSession:
+        # Created lazily so that the session is bound to the running event loop
+        if self.client is None:
+            connector = TCPConnector(
+                limit=AIOHTTP_LIMIT,
+                limit_per_host=AIOHTTP_LIMIT_HOST,
+                keepalive_timeout=75,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True,
+            )
+            self.client = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=30, connect=5),
+                raise_for_status=True,
+            )
+        return self.client
 
     def create_prompt_template(self, tools: List[StructuredTool]) -> ChatPromptTemplate:
+        # The tool list is static, so the prompt only changes with the date
+        today = date.today()
+        if self.prompt is None or self.prompt_date != today:
+            self.prompt = self.build_prompt_template(tools, today)
+            self.prompt_date = today
+        return self.prompt
+
+    def build_prompt_template(
+        self, tools: List[StructuredTool], today_date: date
+    ) -> ChatPromptTemplate:
         # Create new prompt template
         tool_strings = "\n".join(
             [f"> {tool.name}: {tool.description}" for tool in tools]
@@ -150,8 +319,7 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
         format_instructions = FORMAT_INSTRUCTIONS.format(
             tool_names=tool_names,
         )
-        today_date = date.today().strftime("%Y-%m-%d")
-        today = f"Today is {today_date}."
+        today = f"Today is {today_date.strftime('%Y-%m-%d')}."
         template = "\n\n".join(
             [PREFIX, tool_strings, format_instructions, SUFFIX, today]
         )
@@ -172,11 +340,15 @@ class LangChainToolsOrchestrator(BaseOrchestrator):
                 raise Exception("Message type not found.")
         return messages
 
-    def close_clients(self):
-        close_client_tasks = [
-            asyncio.create_task(a.close()) for a in self._user_sessions.values()
-        ]
-        asyncio.gather(*close_client_tasks)
+    async def warm_up(self):
+        # Build the LLM, HTTP client, prompt and one idle agent ahead of the
+        # first request, so the first user doesn't pay for them
+        if not self._agent_pool:
+            self._agent_pool.append(await self.create_agent([]))
+
+    async def close_clients(self):
+        if self.client is not None:
+            await self.client.close()
 
 
 PREFIX = """SFO Airport Assistant helps travelers find their way at the airport.
@@ -199,7 +371,7 @@ and an action_input key (tool input).
 
 Valid "action" values: "Final Answer" or {tool_names}
 
-Provide only ONE action per $JSON_BLOB, as shown:
+A $JSON_BLOB usually holds a single action, as shown:
 
 ```
 {{{{
@@ -208,6 +380,22 @@ Provide only ONE action per $JSON_BLOB, as shown:
 }}}}
 ```
 
+If several tool calls do not depend on each other's results, a $JSON_BLOB may
+instead be a list of actions, which are run at the same time:
+
+```
+[
+  {{{{
+    "action": $TOOL_NAME,
+    "action_input": $INPUT
+  }}}},
+  {{{{
+    "action": $TOOL_NAME,
+    "action_input": $INPUT
+  }}}}
+]
+```
+
 Follow this format:
 
 Question: input question to answer
@@ -228,7 +416,8 @@ Action:
 ```"""
 
 SUFFIX = """Begin! Use tools if necessary. Respond directly if appropriate.
-If using a tool, reminder to ALWAYS respond with a valid json blob of a single action.
+If using a tool, reminder to ALWAYS respond with a valid json blob of a single action
+or of a list of independent actions.
 Format is Action:```$JSON_BLOB```then Observation:.
 Thought:
 
@@ -0,0 +1,185 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.exceptions import OutputParserException
+
+from .langchain_tools_orchestrator import (
+    LangChainToolsOrchestrator,
+    MultiActionOutputParser,
+)
+
+
+@pytest_asyncio.fixture
+async def orchestrator(orchestrator_state):
+    orchestrator = LangChainToolsOrchestrator()
+    yield orchestrator
+    await orchestrator.close_clients()
+
+
+async def create_session(orchestrator: LangChainToolsOrchestrator) -> str:
+    session: dict = {}
+    await orchestrator.user_session_create(session)
+    return session["uuid"]
+
+
+def action_text(blob: str) -> str:
+    return f"Thought: look it up\nAction:\n```\n{blob}\n```"
+
+
+def test_multi_action_parser_single_action():
+    text = action_text('{"action": "Get Flight", "action_input": {"id": 1}}')
+    assert MultiActionOutputParser().parse(text) == AgentAction(
+        "Get Flight", {"id": 1}, text
+    )
+
+
+def test_multi_action_parser_multiple_actions():
+    text = action_text(
+        '[{"action": "Get Flight", "action_input": {"id": 1}},'
+        ' {"action": "Get Flight", "action_input": {"id": 2}}]'
+    )
+    assert MultiActionOutputParser().parse(text) == [
+        AgentAction("Get Flight", {"id": 1}, text),
+        AgentAction("Get Flight", {"id": 2}, ""),
+    ]
+
+
+def test_multi_action_parser_final_answer_in_list():
+    text = action_text(
+        '[{"action": "Get Flight", "action_input": {"id": 1}},'
+        ' {"action": "Final Answer", "action_input": "Done"}]'
+    )
+    assert MultiActionOutputParser().parse(text) == AgentFinish(
+        {"output": "Done"}, text
+    )
+
+
+@pytest.mark.parametrize(
+    "blob",
+    [
+        pytest.param(
+            '[{"action_input": {"id": 1}}, {"action": "Get Flight"}]',
+            id="missing_action",
+        ),
+        pytest.param('["Get Flight", "Get Flight"]', id="list_of_strings"),
+    ],
+)
+def test_multi_action_parser_malformed_list(blob):
+    with pytest.raises(OutputParserException):
+        MultiActionOutputParser().parse(action_text(blob))
+
+
+@pytest.mark.asyncio
+async def test_reset_pools_agent_with_fresh_headers(orchestrator):
+    uuid = await create_session(orchestrator)
+    orchestrator.set_user_session_header(uuid, "AAA")
+    user_session = orchestrator.get_user_session(uuid)
+    old_headers = user_session.headers
+    await orchestrator.user_session_reset(uuid)
+    assert orchestrator._agent_pool == [user_session]
+
+    new_uuid = await create_session(orchestrator)
+    assert orchestrator.get_user_session(new_uuid) is user_session
+    assert user_session.headers == {}
+    assert user_session.headers is not old_headers
+
+
+@pytest.mark.asyncio
+async def test_reset_during_turn_pools_agent_after_turn(orchestrator):
+    uuid = await create_session(orchestrator)
+    user_session = orchestrator.get_user_session(uuid)
+    turn = asyncio.create_task(orchestrator.user_session_invoke(uuid, "hi"))
+    while user_session.turns_in_flight == 0:
+        await asyncio.sleep(0)
+    await orchestrator.user_session_reset(uuid)
+    assert orchestrator._agent_pool == []
+
+    # A new session must not pick up the agent that is still running
+    new_uuid = await create_session(orchestrator)
+    assert orchestrator.get_user_session(new_uuid) is not user_session
+    assert await turn == "Done"
+    assert orchestrator._agent_pool == [user_session]
+
+
+@pytest.mark.asyncio
+async def test_evict_oldest_session_even_if_it_chatted(orchestrator):
+    with patch(f"{LangChainToolsOrchestrator.__module__}.MAX_USER_SESSIONS", 3):
+        first = await create_session(orchestrator)
+        second = await create_session(orchestrator)
+        await orchestrator.user_session_invoke(first, "hi")
+        await orchestrator.user_session_invoke(second, "hi")
+        browsing = await create_session(orchestrator)
+        newest = await create_session(orchestrator)
+    # New visitors that haven't chatted yet must not be evicted ahead of
+    # older sessions
+    assert list(orchestrator._user_sessions) == [second, browsing, newest]
+    assert first not in orchestrator._histories
+
+
+@pytest.mark.asyncio
+async def test_evict_least_recently_used(orchestrator):
+    with patch(f"{LangChainToolsOrchestrator.__module__}.MAX_USER_SESSIONS", 2):
+        first = await create_session(orchestrator)
+        second = await create_session(orchestrator)
+        await orchestrator.user_session_invoke(first, "hi")
+        await orchestrator.user_session_invoke(second, "hi")
+        orchestrator.get_user_session_history(first)
+        third = await create_session(orchestrator)
+    assert list(orchestrator._user_sessions) == [first, third]
+    assert len(orchestrator._agent_pool) == 0
+
+
+@pytest.mark.asyncio
+async def test_evict_skips_sessions_with_turn_in_flight(orchestrator):
+    with patch(f"{LangChainToolsOrchestrator.__module__}.MAX_USER_SESSIONS", 1):
+        first = await create_session(orchestrator)
+        user_session = orchestrator.get_user_session(first)
+        turn = asyncio.create_task(orchestrator.user_session_invoke(first, "hi"))
+        while user_session.turns_in_flight == 0:
+            await asyncio.sleep(0)
+        second = await create_session(orchestrator)
+        assert list(orchestrator._user_sessions) == [first, second]
+        assert await turn == "Done"
+
+
+@pytest.mark.asyncio
+async def test_evicted_session_is_recreated_empty(orchestrator):
+    with patch(f"{LangChainToolsOrchestrator.__module__}.MAX_USER_SESSIONS", 1):
+        session = {}
+        await orchestrator.user_session_create(session)
+        await orchestrator.user_session_invoke(session["uuid"], "hi")
+        await create_session(orchestrator)
+        assert not orchestrator.user_session_exist(session["uuid"])
+
+        await orchestrator.user_session_create(session)
+    assert orchestrator.user_session_exist(session["uuid"])
+    assert len(orchestrator.get_user_session_history(session["uuid"])) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("window_turns, kept_messages", [(0, 0), (1, 2), (5, 7)])
+async def test_invoke_trims_memory_to_window(orchestrator, window_turns, kept_messages):
+    module = LangChainToolsOrchestrator.__module__
+    with patch(f"{module}.MEMORY_WINDOW_TURNS", window_turns):
+        uuid = await create_session(orchestrator)
+        for _ in range(3):
+            await orchestrator.user_session_invoke(uuid, "hi")
+    memory = orchestrator.get_user_session(uuid).agent.memory
+    assert len(memory.chat_memory.messages) == kept_messages
@@ -12,12 +12,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import json
 import os
-from datetime import datetime
-from typing import Optional
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Callable, Optional
 
 import aiohttp
 import google.oauth2.id_token  # type: ignore
+import ijson  # type: ignore
 from google.auth import compute_engine  # type: ignore
 from google.auth.transport.requests import Request  # type: ignore
 from langchain.agents.agent import ExceptionTool  # type: ignore
@@ -25,38 +31,106 @@ from langchain.tools import StructuredTool
 from pydantic.v1 import BaseModel, Field
 
 BASE_URL = os.getenv("BASE_URL", default="http://127.0.0.1:8080")
-CREDENTIALS = None
+# Cached ID tokens and their expiry as a unix timestamp, keyed by audience
+_TOKENS: dict[str, tuple[str, Optional[float]]] = {}
+_TOKEN_LOCKS: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# Refresh an ID token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 60
 
 
 def filter_none_values(params: dict) -> dict:
     return {key: value for key, value in params.items() if value is not None}
 
 
-def get_id_token():
-    global CREDENTIALS
-    if CREDENTIALS is None:
-        CREDENTIALS, _ = google.auth.default()
-        if not hasattr(CREDENTIALS, "id_token"):
-            # Use Compute Engine default credential
-            CREDENTIALS = compute_engine.IDTokenCredentials(
-                request=Request(),
-                target_audience=BASE_URL,
-                use_metadata_identity_endpoint=True,
-            )
-    if not CREDENTIALS.valid:
-        CREDENTIALS.refresh(Request())
-    if hasattr(CREDENTIALS, "id_token"):
-        return CREDENTIALS.id_token
+def to_json(value: Any) -> str:
+    """Serialize tool results into a compact JSON string for the LLM."""
+    return json.dumps(value, separators=(",", ":"))
+
+
+async def read_json_items(
+    response: aiohttp.ClientResponse, num: int
+) -> tuple[list[Any], int]:
+    """Stream a JSON array response, keeping only its first `num` items.
+
+    Returns the kept items and the total number of items in the array.
+    The whole body is still parsed to count the items, and ijson spends
+    roughly twice the CPU of json.loads doing it. The gain is memory: only
+    `num` items are ever built, however long the array is.
+    """
+    items: list[Any] = []
+    count = 0
+    async for item in ijson.items_async(response.content, "item", use_float=True):
+        if count < num:
+            items.append(item)
+        count += 1
+    return items, count
+
+
+@lru_cache
+def _get_credentials(target_audience: str):
+    credentials, _ = google.auth.default()
+    if not hasattr(credentials, "id_token"):
+        # Use Compute Engine default credential
+        credentials = compute_engine.IDTokenCredentials(
+            request=Request(),
+            target_audience=target_audience,
+            use_metadata_identity_endpoint=True,
+        )
+    return credentials
+
+
+def _refresh_id_token(target_audience: str) -> tuple[str, Optional[float]]:
+    """Refresh credentials and return the ID token with its expiry.
+
+    This makes blocking HTTP calls and must not run on the event loop.
+    """
+    credentials = _get_credentials(target_audience)
+    credentials.refresh(Request())
+    if hasattr(credentials, "id_token"):
+        token = credentials.id_token
     else:
-        return CREDENTIALS.token
+        token = credentials.token
+    expiry = None
+    if credentials.expiry is not None:
+        # google-auth stores expiry as a naive UTC datetime
+        expiry = credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+    return token, expiry
+
+
+def _cached_id_token(target_audience: str) -> Optional[str]:
+    cached = _TOKENS.get(target_audience)
+    if cached is None:
+        return None
+    token, expiry = cached
+    if expiry is None:
+        # Without an expiry, the token is good until the credentials say otherwise
+        return token if _get_credentials(target_audience).valid else None
+    if time.time() < expiry - TOKEN_REFRESH_MARGIN:
+        return token
+    return None
+
+
+async def _get_id_token(target_audience: str = BASE_URL) -> str:
+    token = _cached_id_token(target_audience)
+    if token is not None:
+        return token
+    # Only one coroutine refreshes each audience; the others wait for it
+    async with _TOKEN_LOCKS[target_audience]:
+        token = _cached_id_token(target_audience)
+        if token is not None:
+            return token
+        _TOKENS[target_audience] = await asyncio.to_thread(
+            _refresh_id_token, target_audience
+        )
+        return _TOKENS[target_audience][0]
 
 
-def get_headers(client: aiohttp.ClientSession):
+async def get_headers(user_headers: dict[str, str]) -> dict[str, str]:
     """Helper method to generate ID tokens for authenticated requests"""
-    headers = client.headers
+    headers = dict(user_headers)
     if not "http://" in BASE_URL:
         # Append ID Token to make authenticated requests to Cloud Run services
-        headers["Authorization"] = f"Bearer {get_id_token()}"
+        headers["Authorization"] = f"Bearer {await _get_id_token()}"
     return headers
 
 
@@ -67,7 +141,9 @@ class AirportSearchInput(BaseModel):
     name: Optional[str] = Field(description="Airport name")
 
 
-def generate_search_airports(client: aiohttp.ClientSession):
+def generate_search_airports(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def search_airports(country: str, city: str, name: str):
         params = {
             "country": country,
@@ -77,20 +153,20 @@ def generate_search_airports(client: aiohttp.ClientSession):
         response = await client.get(
             url=f"{BASE_URL}/airports/search",
             params=filter_none_values(params),
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
         num = 2
-        response_json = await response.json()
-        if len(response_json) < 1:
+        results, count = await read_json_items(response, num)
+        if count < 1:
             return "There are no airports matching that query. Let the user know there are no results."
-        elif len(response_json) > num:
+        elif count > num:
             return (
-                f"There are {len(response_json)} airports matching that query. Here are the first {num} results:\n"
-                + " ".join([f"{response_json[i]}" for i in range(num)])
+                f"There are {count} airports matching that query. Here are the first {num} results:\n"
+                + to_json(results)
             )
         else:
-            return "\n".join([f"{r}" for r in response_json])
+            return to_json(results)
 
     return search_airports
 
@@ -100,15 +176,17 @@ class FlightNumberInput(BaseModel):
     flight_number: str = Field(description="1 to 4 digit number")
 
 
-def generate_search_flights_by_number(client: aiohttp.ClientSession):
+def generate_search_flights_by_number(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def search_flights_by_number(airline: str, flight_number: str):
         response = await client.get(
             url=f"{BASE_URL}/flights/search",
             params={"airline": airline, "flight_number": flight_number},
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
-        return await response.json()
+        return to_json(await response.json())
 
     return search_flights_by_number
 
@@ -121,7 +199,9 @@ class ListFlights(BaseModel):
     date: Optional[str] = Field(description="Date of flight departure")
 
 
-def generate_list_flights(client: aiohttp.ClientSession):
+def generate_list_flights(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def list_flights(
         departure_airport: str,
         arrival_airport: str,
@@ -135,20 +215,20 @@ def generate_list_flights(client: aiohttp.ClientSession):
         response = await client.get(
             url=f"{BASE_URL}/flights/search",
             params=filter_none_values(params),
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
         num = 2
-        response_json = await response.json()
-        if len(response_json) < 1:
+        results, count = await read_json_items(response, num)
+        if count < 1:
             return "There are no flights matching that query. Let the user know there are no results."
-        elif len(response_json) > num:
+        elif count > num:
             return (
-                f"There are {len(response_json)} flights matching that query. Here are the first {num} results:\n"
-                + " ".join([f"{response_json[i]}" for i in range(num)])
+                f"There are {count} flights matching that query. Here are the first {num} results:\n"
+                + to_json(results)
             )
         else:
-            return "\n".join([f"{r}" for r in response_json])
+            return to_json(results)
 
     return list_flights
 
@@ -157,16 +237,17 @@ class QueryInput(BaseModel):
     query: str = Field(description="Search query")
 
 
-def generate_search_amenities(client: aiohttp.ClientSession):
+def generate_search_amenities(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def search_amenities(query: str):
         response = await client.get(
             url=f"{BASE_URL}/amenities/search",
             params={"top_k": "5", "query": query},
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
-        response = await response.json()
-        return response
+        return to_json(await response.json())
 
     return search_amenities
 
@@ -182,7 +263,9 @@ class TicketInput(BaseModel):
     arrival_time: datetime = Field(description="Flight arrival datetime")
 
 
-def generate_insert_ticket(client: aiohttp.ClientSession):
+def generate_insert_ticket(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def insert_ticket(
         airline: str,
         flight_number: str,
@@ -201,33 +284,35 @@ def generate_insert_ticket(client: aiohttp.ClientSession):
                 "departure_time": departure_time.strftime("%Y-%m-%d %H:%M:%S"),
                 "arrival_time": arrival_time.strftime("%Y-%m-%d %H:%M:%S"),
             },
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
-        response = await response.json()
-        return response
+        return to_json(await response.json())
 
     return insert_ticket
 
 
-def generate_list_tickets(client: aiohttp.ClientSession):
+def generate_list_tickets(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     async def list_tickets():
         response = await client.get(
             url=f"{BASE_URL}/tickets/list",
-            headers=get_headers(client),
+            headers=await get_headers(get_user_headers()),
         )
 
-        response = await response.json()
-        return response
+        return to_json(await response.json())
 
     return list_tickets
 
 
 # Tools for agent
-async def initialize_tools(client: aiohttp.ClientSession):
+async def initialize_tools(
+    client: aiohttp.ClientSession, get_user_headers: Callable[[], dict[str, str]]
+):
     return [
         StructuredTool.from_function(
-            coroutine=generate_search_airports(client),
+            coroutine=generate_search_airports(client, get_user_headers),
             name="Search Airport",
             description="""
                         Use this tool to list all airports matching search criteria.
@@ -256,7 +341,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=AirportSearchInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_search_flights_by_number(client),
+            coroutine=generate_search_flights_by_number(client, get_user_headers),
             name="Search Flights By Flight Number",
             description="""
                         Use this tool to get info for a specific flight. Do NOT use this tool with a flight id.
@@ -269,7 +354,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=FlightNumberInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_list_flights(client),
+            coroutine=generate_list_flights(client, get_user_headers),
             name="List Flights",
             description="""
                         Use this tool to list all flights matching search criteria.
@@ -298,7 +383,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=ListFlights,
         ),
         StructuredTool.from_function(
-            coroutine=generate_search_amenities(client),
+            coroutine=generate_search_amenities(client, get_user_headers),
             name="Search Amenities",
             description="""
                         Use this tool to search amenities by name or to recommended airport amenities at SFO.
@@ -312,7 +397,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=QueryInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_insert_ticket(client),
+            coroutine=generate_insert_ticket(client, get_user_headers),
             name="Insert Ticket",
             description="""
                         Use this tool to book a flight ticket for the user.
@@ -347,7 +432,7 @@ async def initialize_tools(client: aiohttp.ClientSession):
             args_schema=TicketInput,
         ),
         StructuredTool.from_function(
-            coroutine=generate_list_tickets(client),
+            coroutine=generate_list_tickets(client, get_user_headers),
             name="List Tickets",
             description="""
                         Use this tool to list a user's flight tickets.
@@ -0,0 +1,123 @@
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+from unittest.mock import patch
+
+import pytest
+
+from . import tools
+
+pytestmark = pytest.mark.asyncio
+
+
+class FakeCredentials:
+    def __init__(self, lifetime: Optional[timedelta]):
+        self.lifetime = lifetime
+        self.refreshes = 0
+        self.id_token: Optional[str] = None
+        self.expiry: Optional[datetime] = None
+        self.valid = False
+
+    def refresh(self, request):
+        # Slow enough for concurrent callers to pile up on the lock
+        time.sleep(0.05)
+        self.refreshes += 1
+        self.id_token = f"token-{self.refreshes}"
+        if self.lifetime is not None:
+            self.expiry = datetime.utcnow() + self.lifetime
+        self.valid = True
+
+
+@pytest.fixture(autouse=True)
+def clear_tokens():
+    tools._TOKENS.clear()
+    tools._TOKEN_LOCKS.clear()
+    yield
+    tools._TOKENS.clear()
+    tools._TOKEN_LOCKS.clear()
+
+
+async def test_get_id_token_refreshes_once_for_concurrent_callers():
+    credentials = FakeCredentials(timedelta(hours=1))
+    with patch.object(tools, "_get_credentials", return_value=credentials):
+        tokens = await asyncio.gather(*(tools._get_id_token("aud") for _ in range(5)))
+    assert tokens == ["token-1"] * 5
+    assert credentials.refreshes == 1
+
+
+async def test_get_id_token_caches_per_audience():
+    credentials = {
+        "aud-1": FakeCredentials(timedelta(hours=1)),
+        "aud-2": FakeCredentials(timedelta(hours=1)),
+    }
+    with patch.object(tools, "_get_credentials", side_effect=credentials.get):
+        await asyncio.gather(tools._get_id_token("aud-1"), tools._get_id_token("aud-2"))
+        await tools._get_id_token("aud-1")
+    assert credentials["aud-1"].refreshes == 1
+    assert credentials["aud-2"].refreshes == 1
+
+
+async def test_get_id_token_refreshes_within_margin():
+    lifetime = timedelta(seconds=tools.TOKEN_REFRESH_MARGIN - 1)
+    credentials = FakeCredentials(lifetime)
+    with patch.object(tools, "_get_credentials", return_value=credentials):
+        assert await tools._get_id_token("aud") == "token-1"
+        assert await tools._get_id_token("aud") == "token-2"
+
+
+async def test_get_id_token_without_expiry_uses_valid():
+    credentials = FakeCredentials(None)
+    with patch.object(tools, "_get_credentials", return_value=credentials):
+        assert await tools._get_id_token("aud") == "token-1"
+        assert await tools._get_id_token("aud") == "token-1"
+        credentials.valid = False
+        assert await tools._get_id_token("aud") == "token-2"
+    assert credentials.refreshes == 2
+
+
+class FakeResponse:
+    """Serves a JSON body in small chunks, like aiohttp's StreamReader."""
+
+    def __init__(self, value: Any):
+        self.body = json.dumps(value).encode()
+        self.content = self
+
+    async def read(self, n: int = -1) -> bytes:
+        n = len(self.body) if n < 0 else min(n, 7)
+        chunk, self.body = self.body[:n], self.body[n:]
+        return chunk
+
+
+@pytest.mark.parametrize(
+    "value, expected_items, expected_count",
+    [
+        pytest.param([], [], 0, id="empty"),
+        pytest.param([{"id": 1}], [{"id": 1}], 1, id="fewer_than_num"),
+        pytest.param(
+            [{"id": i, "price": i / 2} for i in range(5)],
+            [{"id": 0, "price": 0.0}, {"id": 1, "price": 0.5}],
+            5,
+            id="more_than_num",
+        ),
+    ],
+)
+async def test_read_json_items(value, expected_items, expected_count):
+    items, count = await tools.read_json_items(FakeResponse(value), 2)
+    assert items == expected_items
+    assert count == expected_count
@@ -55,9 +55,24 @@ class BaseOrchestrator(ABC):
     def get_user_session(self, uuid: str) -> Any:
         raise NotImplementedError("Subclass should implement this!")
 
+    @abstractmethod
+    def get_user_session_history(self, uuid: str) -> list[Any]:
+        """Return the chat history of a user session."""
+        raise NotImplementedError("Subclass should implement this!")
+
+    @abstractmethod
+    async def warm_up(self):
+        """Prepare shared clients before the first user session."""
+        raise NotImplementedError("Subclass should implement this!")
+
+    @abstractmethod
+    async def close_clients(self):
+        """Close clients shared by user sessions."""
+        raise NotImplementedError("Subclass should implement this!")
+
     def set_user_session_header(self, uuid: str, user_id_token: str):
         user_session = self.get_user_session(uuid)
-        user_session.client.headers["User-Id-Token"] = f"Bearer {user_id_token}"
+        user_session.headers["User-Id-Token"] = f"Bearer {user_id_token}"
 
 
 def createOrchestrator(orchestration_type: str) -> "BaseOrchestrator":
@@ -21,7 +21,7 @@ import uvicorn
 from app import init_app
 
 
-async def main():
+def main():
     PORT = int(os.getenv("PORT", default=8081))
     HOST = os.getenv("HOST", default="0.0.0.0")
     ORCHESTRATION_TYPE = os.getenv("ORCHESTRATION_TYPE")
@@ -30,9 +30,12 @@ async def main():
     app = init_app(ORCHESTRATION_TYPE, client_id=CLIENT_ID, secret_key=SECRET_KEY)
     if app is None:
         raise TypeError("app not instantiated")
-    server = uvicorn.Server(uvicorn.Config(app, host=HOST, port=PORT, log_level="info"))
-    await server.serve()
+    config = uvicorn.Config(app, host=HOST, port=PORT, log_level="info")
+    # Server.serve() doesn't set up the event loop itself, so have uvicorn pick
+    # uvloop when it is installed, as uvicorn.run() would
+    config.setup_event_loop()
+    asyncio.run(uvicorn.Server(config).serve())
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
@@ -61,6 +61,8 @@ async function askQuestion(prompt) {
     if (response.ok) {
         const text = await response.text();
         return text
+    } else if (response.status == 410) {
+        return "Your session has expired, please reload the page 🔄"
     } else {
         console.error(await response.text())
         return "Sorry, we couldn't answer your question 😢"
@@ -21,7 +21,7 @@ from fastapi.testclient import TestClient
 import datastore
 import models
 
-from . import init_app
+from . import init_app, routes
 from .app import AppConfig
 
 
@@ -35,6 +35,14 @@ def app():
     return app
 
 
+@pytest.fixture(autouse=True)
+def clear_query_embeddings():
+    # The query embedding cache is module state, so don't leak it across tests
+    routes._query_embeddings.clear()
+    yield
+    routes._query_embeddings.clear()
+
+
 @patch.object(datastore, "create")
 def test_hello_world(m_datastore, app):
     m_datastore = AsyncMock()
@@ -406,6 +414,42 @@ def test_amenities_search(m_datastore, app, method_name, params, mock_return, ex
     assert models.Amenity.model_validate(output[0])
 
 
+@patch("app.app.VertexAIEmbeddings")
+@patch.object(datastore, "create")
+def test_amenities_search_caches_query_embedding(m_datastore, m_embeddings, app):
+    m_embed_query = m_embeddings.return_value.embed_query
+    m_embed_query.return_value = [0.1, 0.2]
+    with TestClient(app) as client:
+        with patch.object(
+            m_datastore.return_value, "amenities_search", AsyncMock(return_value=[])
+        ) as mock_method:
+            for _ in range(2):
+                response = client.get(
+                    "/amenities/search",
+                    params={"query": "A place to get food.", "top_k": 2},
+                )
+                assert response.status_code == 200
+    m_embed_query.assert_called_once_with("A place to get food.")
+    assert mock_method.call_count == 2
+    mock_method.assert_called_with([0.1, 0.2], 0.5, 2)
+
+
+@patch.object(routes, "QUERY_EMBEDDING_CACHE_SIZE", 2)
+def test_query_embedding_cache_evicts_least_recently_used():
+    embed_service = MagicMock()
+    embed_service.embed_query.side_effect = lambda query: [float(len(query))]
+    for query in ["a", "bb", "a", "ccc", "a", "bb"]:
+        routes.get_query_embedding(embed_service, query)
+    # "a" was used again before "ccc" was added, so "bb" was evicted first
+    assert [c.args[0] for c in embed_service.embed_query.call_args_list] == [
+        "a",
+        "bb",
+        "ccc",
+        "bb",
+    ]
+    assert list(routes._query_embeddings) == ["a", "bb"]
+
+
 get_flight_params = [
     pytest.param(
         "get_flight",
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 import os
+from collections import OrderedDict
 from typing import Any, Mapping, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request
@@ -23,6 +24,9 @@ from langchain.embeddings.base import Embeddings
 import datastore
 
 routes = APIRouter()
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", default=1024))
+# Embeddings of recent search queries, least recently used first
+_query_embeddings: OrderedDict[str, list[float]] = OrderedDict()
 
 
 def _ParseUserIdToken(headers: Mapping[str, Any]) -> Optional[str]:
@@ -99,6 +103,19 @@ async def search_airports(
     return results
 
 
+def get_query_embedding(embed_service: Embeddings, query: str) -> list[float]:
+    """Embed a search query, reusing the result for repeated queries."""
+    embedding = _query_embeddings.get(query)
+    if embedding is not None:
+        _query_embeddings.move_to_end(query)
+        return embedding
+    embedding = embed_service.embed_query(query)
+    _query_embeddings[query] = embedding
+    if len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+        _query_embeddings.popitem(last=False)
+    return embedding
+
+
 @routes.get("/amenities")
 async def get_amenity(id: int, request: Request):
     ds: datastore.Client = request.app.state.datastore
@@ -111,7 +128,7 @@ async def amenities_search(query: str, top_k: int, request: Request):
     ds: datastore.Client = request.app.state.datastore
 
     embed_service: Embeddings = request.app.state.embed_service
-    query_embedding = embed_service.embed_query(query)
+    query_embedding = get_query_embedding(embed_service, query)
 
     results = await ds.amenities_search(query_embedding, 0.5, top_k)
     return results
@@ -43,28 +43,32 @@ class Config(BaseModel, datastore.AbstractConfig):
 
 class Client(datastore.Client[Config]):
     __pool: AsyncEngine
+    __connector: Connector
 
     @datastore.classproperty
     def kind(cls):
         return "cloudsql-postgres"
 
-    def __init__(self, pool: AsyncEngine):
+    def __init__(self, pool: AsyncEngine, connector: Connector):
         self.__pool = pool
+        self.__connector = connector
 
     @classmethod
     async def create(cls, config: Config) -> "Client":
         loop = asyncio.get_running_loop()
+        # Keep one connector for the client's lifetime so that every pooled
+        # connection reuses its cached instance metadata and certificates
+        connector = Connector(loop=loop)
 
         async def getconn() -> asyncpg.Connection:
-            async with Connector(loop=loop) as connector:
-                conn: asyncpg.Connection = await connector.connect_async(
-                    # Cloud SQL instance connection name
-                    f"{config.project}:{config.region}:{config.instance}",
-                    "asyncpg",
-                    user=f"{config.user}",
-                    password=f"{config.password}",
-                    db=f"{config.database}",
-                )
+            conn: asyncpg.Connection = await connector.connect_async(
+                # Cloud SQL instance connection name
+                f"{config.project}:{config.region}:{config.instance}",
+                "asyncpg",
+                user=f"{config.user}",
+                password=f"{config.password}",
+                db=f"{config.database}",
+            )
             await register_vector(conn)
             return conn
 
@@ -74,7 +78,7 @@ class Client(datastore.Client[Config]):
         )
         if pool is None:
             raise TypeError("pool not instantiated")
-        return cls(pool)
+        return cls(pool, connector)
 
     async def initialize_data(
         self,
@@ -99,22 +103,6 @@ class Client(datastore.Client[Config]):
                     """
                 )
             )
-            # Insert all the data
-            await conn.execute(
-                text(
-                    """INSERT INTO airports VALUES (:id, :iata, :name, :city, :country)"""
-                ),
-                [
-                    {
-                        "id": a.id,
-                        "iata": a.iata,
-                        "name": a.name,
-                        "city": a.city,
-                        "country": a.country,
-                    }
-                    for a in airports
-                ],
-            )
 
             await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
             # If the table already exists, drop it to avoid conflicts
@@ -151,47 +139,6 @@ class Client(datastore.Client[Config]):
                     """
                 )
             )
-            # Insert all the data
-            await conn.execute(
-                text(
-                    """
-                    INSERT INTO amenities VALUES (:id, :name, :description, :location,
-                      :terminal, :category, :hour, :sunday_start_hour, :sunday_end_hour,
-                      :monday_start_hour, :monday_end_hour, :tuesday_start_hour,
-                      :tuesday_end_hour, :wednesday_start_hour, :wednesday_end_hour,
-                      :thursday_start_hour, :thursday_end_hour, :friday_start_hour,
-                      :friday_end_hour, :saturday_start_hour, :saturday_end_hour, :content, :embedding)
-                    """
-                ),
-                [
-                    {
-                        "id": a.id,
-                        "name": a.name,
-                        "description": a.description,
-                        "location": a.location,
-                        "terminal": a.terminal,
-                        "category": a.category,
-                        "hour": a.hour,
-                        "sunday_start_hour": a.sunday_start_hour,
-                        "sunday_end_hour": a.sunday_end_hour,
-                        "monday_start_hour": a.monday_start_hour,
-                        "monday_end_hour": a.monday_end_hour,
-                        "tuesday_start_hour": a.tuesday_start_hour,
-                        "tuesday_end_hour": a.tuesday_end_hour,
-                        "wednesday_start_hour": a.wednesday_start_hour,
-                        "wednesday_end_hour": a.wednesday_end_hour,
-                        "thursday_start_hour": a.thursday_start_hour,
-                        "thursday_end_hour": a.thursday_end_hour,
-                        "friday_start_hour": a.friday_start_hour,
-                        "friday_end_hour": a.friday_end_hour,
-                        "saturday_start_hour": a.saturday_start_hour,
-                        "saturday_end_hour": a.saturday_end_hour,
-                        "content": a.content,
-                        "embedding": a.embedding,
-                    }
-                    for a in amenities
-                ],
-            )
 
             # If the table already exists, drop it to avoid conflicts
             await conn.execute(text("DROP TABLE IF EXISTS flights CASCADE"))
@@ -213,32 +160,85 @@ class Client(datastore.Client[Config]):
                     """
                 )
             )
-            # Insert all the data
+            await conn.commit()
+
+        # The tables are independent, so load them concurrently with COPY over
+        # separate pool connections
+        await asyncio.gather(
+            self.__copy_records(
+                "airports",
+                records=[(a.id, a.iata, a.name, a.city, a.country) for a in airports],
+            ),
+            self.__copy_records(
+                "amenities",
+                records=[
+                    (
+                        a.id,
+                        a.name,
+                        a.description,
+                        a.location,
+                        a.terminal,
+                        a.category,
+                        a.hour,
+                        a.sunday_start_hour,
+                        a.sunday_end_hour,
+                        a.monday_start_hour,
+                        a.monday_end_hour,
+                        a.tuesday_start_hour,
+                        a.tuesday_end_hour,
+                        a.wednesday_start_hour,
+                        a.wednesday_end_hour,
+                        a.thursday_start_hour,
+                        a.thursday_end_hour,
+                        a.friday_start_hour,
+                        a.friday_end_hour,
+                        a.saturday_start_hour,
+                        a.saturday_end_hour,
+                        a.content,
+                        a.embedding,
+                    )
+                    for a in amenities
+                ],
+            ),
+            self.__copy_records(
+                "flights",
+                records=[
+                    (
+                        f.id,
+                        f.airline,
+                        f.flight_number,
+                        f.departure_airport,
+                        f.arrival_airport,
+                        f.departure_time,
+                        f.arrival_time,
+                        f.departure_gate,
+                        f.arrival_gate,
+                    )
+                    for f in flights
+                ],
+            ),
+        )
+
+        # Build the index after the bulk load, which is much faster than
+        # updating it for every copied row
+        async with self.__pool.connect() as conn:
             await conn.execute(
                 text(
                     """
-                    INSERT INTO flights VALUES (:id, :airline, :flight_number,
-                      :departure_airport, :arrival_airport, :departure_time,
-                      :arrival_time, :departure_gate, :arrival_gate)
+                    CREATE INDEX ON amenities
+                      USING hnsw (embedding vector_cosine_ops)
                     """
-                ),
-                [
-                    {
-                        "id": f.id,
-                        "airline": f.airline,
-                        "flight_number": f.flight_number,
-                        "departure_airport": f.departure_airport,
-                        "arrival_airport": f.arrival_airport,
-                        "departure_time": f.departure_time,
-                        "arrival_time": f.arrival_time,
-                        "departure_gate": f.departure_gate,
-                        "arrival_gate": f.arrival_gate,
-                    }
-                    for f in flights
-                ],
+                )
             )
             await conn.commit()
 
+    async def __copy_records(self, table_name: str, records: list[tuple]) -> None:
+        async with self.__pool.connect() as conn:
+            raw_conn = (await conn.get_raw_connection()).driver_connection
+            if raw_conn is None:
+                raise TypeError("connection not instantiated")
+            await raw_conn.copy_records_to_table(table_name, records=records)
+
     async def export_data(
         self,
     ) -> tuple[list[models.Airport], list[models.Amenity], list[models.Flight]]:
@@ -258,9 +258,22 @@ class Client(datastore.Client[Config]):
             amenity_results = (await amenity_task).mappings().fetchall()
             flights_results = (await flights_task).mappings().fetchall()
 
-            airports = [models.Airport.model_validate(a) for a in airport_results]
-            amenities = [models.Amenity.model_validate(a) for a in amenity_results]
-            flights = [models.Flight.model_validate(f) for f in flights_results]
+            # Rows come straight from our own tables, so skip pydantic validation
+            airports = [models.Airport.model_construct(**a) for a in airport_results]
+            amenities = [
+                models.Amenity.model_construct(
+                    **{
+                        **a,
+                        "embedding": (
+                            a["embedding"].tolist()
+                            if a["embedding"] is not None
+                            else None
+                        ),
+                    }
+                )
+                for a in amenity_results
+            ]
+            flights = [models.Flight.model_construct(**f) for f in flights_results]
             return airports, amenities, flights
 
     async def get_airport_by_id(self, id: int) -> Optional[models.Airport]:
@@ -340,10 +353,11 @@ class Client(datastore.Client[Config]):
                       SELECT id, name, description, location, terminal, category, hour,
                         1 - (embedding <=> :query_embedding) AS similarity
                       FROM amenities
-                      WHERE 1 - (embedding <=> :query_embedding) > :similarity_threshold
-                      ORDER BY similarity DESC
+                      ORDER BY embedding <=> :query_embedding
                       LIMIT :top_k
                   ) AS sorted_amenities
+                  WHERE similarity > :similarity_threshold
+                  ORDER BY similarity DESC
                 """
             )
             params = {
@@ -444,3 +458,4 @@ class Client(datastore.Client[Config]):
 
     async def close(self):
         await self.__pool.dispose()
+        await self.__connector.close_async()
@@ -86,11 +86,6 @@ class Client(datastore.Client[Config]):
                 )
                 """
             )
-            # Insert all the data
-            await conn.executemany(
-                """INSERT INTO airports VALUES ($1, $2, $3, $4, $5)""",
-                [(a.id, a.iata, a.name, a.city, a.country) for a in airports],
-            )
 
             # If the table already exists, drop it to avoid conflicts
             await conn.execute("DROP TABLE IF EXISTS amenities CASCADE")
@@ -124,17 +119,55 @@ class Client(datastore.Client[Config]):
                 )
                 """
             )
-            # Insert all the data
-            await conn.executemany(
+
+            # If the table already exists, drop it to avoid conflicts
+            await conn.execute("DROP TABLE IF EXISTS flights CASCADE")
+            # Create a new table
+            await conn.execute(
+                """
+                CREATE TABLE flights(
+                  id INTEGER PRIMARY KEY,
+                  airline TEXT,
+                  flight_number TEXT,
+                  departure_airport TEXT,
+                  arrival_airport TEXT,
+                  departure_time TIMESTAMP,
+                  arrival_time TIMESTAMP,
+                  departure_gate TEXT,
+                  arrival_gate TEXT
+                )
                 """
-                INSERT INTO amenities VALUES (
-                  $1, $2, $3, $4, $5,
-                  $6, $7, $8, $9, $10,
-                  $11, $12, $13, $14, $15,
-                  $16, $17, $18, $19, $20,
-                  $21, $22, $23)
-                """,
-                [
+            )
+
+            # If the table already exists, drop it to avoid conflicts
+            await conn.execute("DROP TABLE IF EXISTS tickets CASCADE")
+            # Create a new table
+            await conn.execute(
+                """
+                CREATE TABLE tickets(
+                  user_id TEXT,
+                  user_name TEXT,
+                  user_email TEXT,
+                  airline TEXT,
+                  flight_number TEXT,
+                  departure_airport TEXT,
+                  arrival_airport TEXT,
+                  departure_time TIMESTAMP,
+                  arrival_time TIMESTAMP
+                )
+                """
+            )
+
+        # The tables are independent, so load them concurrently with COPY over
+        # separate pool connections
+        await asyncio.gather(
+            self.__pool.copy_records_to_table(
+                "airports",
+                records=[(a.id, a.iata, a.name, a.city, a.country) for a in airports],
+            ),
+            self.__pool.copy_records_to_table(
+                "amenities",
+                records=[
                     (
                         a.id,
                         a.name,
@@ -162,30 +195,10 @@ class Client(datastore.Client[Config]):
                     )
                     for a in amenities
                 ],
-            )
-
-            # If the table already exists, drop it to avoid conflicts
-            await conn.execute("DROP TABLE IF EXISTS flights CASCADE")
-            # Create a new table
-            await conn.execute(
-                """
-                CREATE TABLE flights(
-                  id INTEGER PRIMARY KEY,
-                  airline TEXT,
-                  flight_number TEXT,
-                  departure_airport TEXT,
-                  arrival_airport TEXT,
-                  departure_time TIMESTAMP,
-                  arrival_time TIMESTAMP,
-                  departure_gate TEXT,
-                  arrival_gate TEXT
-                )
-                """
-            )
-            # Insert all the data
-            await conn.executemany(
-                """INSERT INTO flights VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)""",
-                [
+            ),
+            self.__pool.copy_records_to_table(
+                "flights",
+                records=[
                     (
                         f.id,
                         f.airline,
@@ -199,24 +212,16 @@ class Client(datastore.Client[Config]):
                     )
                     for f in flights
                 ],
-            )
+            ),
+        )
 
-            # If the table already exists, drop it to avoid conflicts
-            await conn.execute("DROP TABLE IF EXISTS tickets CASCADE")
-            # Create a new table
+        # Build the index after the bulk load, which is much faster than
+        # updating it for every copied row
+        async with self.__pool.acquire() as conn:
             await conn.execute(
                 """
-                CREATE TABLE tickets(
-                  user_id TEXT,
-                  user_name TEXT,
-                  user_email TEXT,
-                  airline TEXT,
-                  flight_number TEXT,
-                  departure_airport TEXT,
-                  arrival_airport TEXT,
-                  departure_time TIMESTAMP,
-                  arrival_time TIMESTAMP
-                )
+                CREATE INDEX ON amenities
+                  USING hnsw (embedding vector_cosine_ops)
                 """
             )
 
@@ -233,9 +238,20 @@ class Client(datastore.Client[Config]):
             self.__pool.fetch("""SELECT * FROM flights ORDER BY id ASC""")
         )
 
-        airports = [models.Airport.model_validate(dict(a)) for a in await airport_task]
-        amenities = [models.Amenity.model_validate(dict(a)) for a in await amenity_task]
-        flights = [models.Flight.model_validate(dict(f)) for f in await flight_task]
+        # Rows come straight from our own tables, so skip pydantic validation
+        airports = [models.Airport.model_construct(**a) for a in await airport_task]
+        amenities = [
+            models.Amenity.model_construct(
+                **{
+                    **a,
+                    "embedding": (
+                        a["embedding"].tolist() if a["embedding"] is not None else None
+                    ),
+                }
+            )
+            for a in await amenity_task
+        ]
+        flights = [models.Flight.model_construct(**f) for f in await flight_task]
         return airports, amenities, flights
 
     async def get_airport_by_id(self, id: int) -> Optional[models.Airport]:
@@ -313,10 +329,11 @@ class Client(datastore.Client[Config]):
                 SELECT id, name, description, location, terminal, category,
                   hour, 1 - (embedding <=> $1) AS similarity
                 FROM amenities
-                WHERE 1 - (embedding <=> $1) > $2
-                ORDER BY similarity DESC
+                ORDER BY embedding <=> $1
                 LIMIT $3
             ) AS sorted_amenities
+            WHERE similarity > $2
+            ORDER BY similarity DESC
             """,
             query_embedding,
             similarity_threshold,
@@ -20,51 +20,73 @@ from langchain.embeddings import VertexAIEmbeddings
 import models
 from app import EMBEDDING_MODEL_NAME
 
+# Maximum number of embedding requests in flight at once
+EMBEDDING_CONCURRENCY = 8
+# textembedding-gecko@001 accepts at most 5 texts per request
+EMBEDDING_BATCH_SIZE = 5
+
 
 async def main() -> None:
-    embed_service = VertexAIEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+    # The client sends requests from its own thread pool, so size it to match
+    embed_service = VertexAIEmbeddings(
+        model_name=EMBEDDING_MODEL_NAME, request_parallelism=EMBEDDING_CONCURRENCY
+    )
+    sem = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+    async def embed(batch: list[models.Amenity]) -> list[models.Amenity]:
+        texts = [amenity.content for amenity in batch]
+        async with sem:
+            # Same task type as embed_query, but one request per batch
+            embeddings = await asyncio.to_thread(
+                embed_service.embed, texts, len(texts), "RETRIEVAL_QUERY"
+            )
+        for amenity, embedding in zip(batch, embeddings):
+            amenity.embedding = embedding
+        return batch
 
-    amenities: list[models.Amenity] = []
     with open("../data/amenity_dataset.csv", "r") as f:
         reader = csv.DictReader(f, delimiter=",")
-        for line in reader:
-            amenity = models.Amenity.model_validate(line)
-            if amenity.content:
-                amenity.embedding = embed_service.embed_query(amenity.content)
-                amenities.append(amenity)
-
-    print("Completed embedding generation.")
+        amenities = [models.Amenity.model_validate(line) for line in reader]
+        amenities = [amenity for amenity in amenities if amenity.content]
+    # Embedding requests are network bound, so run the batches concurrently
+    tasks = [
+        asyncio.create_task(embed(amenities[i : i + EMBEDDING_BATCH_SIZE]))
+        for i in range(0, len(amenities), EMBEDDING_BATCH_SIZE)
+    ]
 
+    col_names = [
+        "id",
+        "name",
+        "description",
+        "location",
+        "terminal",
+        "category",
+        "hour",
+        "sunday_start_hour",
+        "sunday_end_hour",
+        "monday_start_hour",
+        "monday_end_hour",
+        "tuesday_start_hour",
+        "tuesday_end_hour",
+        "wednesday_start_hour",
+        "wednesday_end_hour",
+        "thursday_start_hour",
+        "thursday_end_hour",
+        "friday_start_hour",
+        "friday_end_hour",
+        "saturday_start_hour",
+        "saturday_end_hour",
+        "content",
+        "embedding",
+    ]
+    # Write each row as soon as it is ready, so partial results survive errors
     with open("../data/amenity_dataset.csv.new", "w") as f:
-        col_names = [
-            "id",
-            "name",
-            "description",
-            "location",
-            "terminal",
-            "category",
-            "hour",
-            "sunday_start_hour",
-            "sunday_end_hour",
-            "monday_start_hour",
-            "monday_end_hour",
-            "tuesday_start_hour",
-            "tuesday_end_hour",
-            "wednesday_start_hour",
-            "wednesday_end_hour",
-            "thursday_start_hour",
-            "thursday_end_hour",
-            "friday_start_hour",
-            "friday_end_hour",
-            "saturday_start_hour",
-            "saturday_end_hour",
-            "content",
-            "embedding",
-        ]
         writer = csv.DictWriter(f, col_names, delimiter=",")
         writer.writeheader()
-        for amenity in amenities:
-            writer.writerow(amenity.model_dump())
+        for task in tasks:
+            for amenity in await task:
+                writer.writerow(amenity.model_dump())
+            f.flush()
 
     print("Wrote data to CSV.")
 